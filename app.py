@@ -13,50 +13,176 @@ Web界面用于配置和监控Aruba License使用情况
 """
 
 import os
-import json
 import time
+import atexit
 import datetime
 import threading
+import itertools
+import operator
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener, WatchedFileHandler
 import smtplib
 import socket
-import fcntl
 import tempfile
+import glob
+import hashlib
+import signal
+import argparse
+import re
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # Windows没有fcntl，仅多worker进程部署时需要文件锁
+from concurrent.futures import ThreadPoolExecutor, Future, TimeoutError as FutureTimeoutError
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from typing import Dict, Any, List, Optional
-from flask import Flask, render_template, request, jsonify, redirect, url_for
+from typing import Dict, Any, List, Optional, Tuple
+from flask import Flask, render_template, request, jsonify, redirect, url_for, send_from_directory
+from flask.json.provider import DefaultJSONProvider
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+try:
+    from waitress import serve as waitress_serve
+except ImportError:
+    waitress_serve = None  # 未安装waitress时使用Flask内置服务器
 
 # 禁用SSL警告
 requests.packages.urllib3.disable_warnings()
 
+
+class OrjsonProvider(DefaultJSONProvider):
+    """使用orjson序列化Flask的JSON响应并解析JSON请求体"""
+    
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        option = orjson.OPT_NON_STR_KEYS
+        if kwargs.get('indent'):
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=self.default, option=option).decode('utf-8')
+    
+    def loads(self, s: Any, **kwargs: Any) -> Any:
+        return orjson.loads(s)
+
+
 app = Flask(__name__)
 app.secret_key = 'aruba_license_monitor_secret_key'
+app.json = OrjsonProvider(app)
+# 部署在nginx/Apache之后时由前端服务器直接发送静态文件
+app.use_x_sendfile = os.environ.get('USE_X_SENDFILE') == '1'
 
 # 全局变量
 config_data = {}          # 存储应用配置数据
+config_state = None       # 已加载配置文件的 (inode, 修改时间, 大小)，用于跳过重复解析
 license_data = {}         # 存储License使用数据
+license_snapshot = ({}, {}, '')  # (License数据, 预先计算的License摘要, 内容哈希ETag)，整体替换保证三者一致
+alert_last_sent = {}      # 主机上次成功发送告警的时间 {(主机名, 告警类型): time.monotonic()}
+alert_last_sent_lock = threading.Lock()
 polling_thread = None     # 后台轮询线程对象
-polling_active = False    # 轮询状态标志
+polling_active = threading.Event()  # 轮询状态标志，置位期间轮询线程持续运行
+polling_thread_lock = threading.Lock()  # 保证进程内只启动一个轮询线程
+config_changed = threading.Event()  # 配置变化或停止轮询时置位，轮询线程立即从等待中唤醒
 notification_manager = None  # 通知管理器对象
-active_threads = set()    # 跟踪活跃的轮询线程ID
+license_log_file = None   # 最近写入的License数据日志文件
+license_log_state = None  # Web进程已加载的数据日志 (文件名, 文件状态)
+embedded_poller = os.environ.get('EMBEDDED_POLLER', '1') == '1'  # 是否在Web进程内运行轮询线程
+flask_debug = os.environ.get('FLASK_DEBUG') == '1'  # 调试模式，仅开发时通过环境变量开启
+use_reloader = flask_debug and os.environ.get('FLASK_USE_RELOADER') == '1'  # 调试时可选启用自动重载
 lock_file_path = os.path.join(tempfile.gettempdir(), 'aruba_license_monitor.lock')
+# mkstemp创建的临时文件权限为0600，原子替换前改回按umask计算的默认权限，
+# 以便不同用户运行的Web进程和轮询进程共享配置文件（umask只能通过设置来读取，在导入时读取一次）
+file_umask = os.umask(0)
+os.umask(file_umask)
+FILE_MODE = 0o666 & ~file_umask
+show_command_cache = {}   # show命令结果缓存 {(控制器IP, 命令): (获取时间, 数据)}
+show_command_cache_lock = threading.Lock()
+SHOW_COMMAND_CACHE_MAXSIZE = 256
+show_command_inflight = {}  # 正在执行的show命令 {(控制器IP, 命令): Future}，相同请求共享结果
+# 所有show命令共用的线程池，限制同时发往控制器的请求数，避免每次轮询创建新线程
+show_command_executor = ThreadPoolExecutor(max_workers=20, thread_name_prefix='show_command')
+
+# 控制器请求的重试策略：连接错误及429/5xx时指数退避（带随机抖动）重试，429优先遵循Retry-After
+CONTROLLER_RETRY = Retry(total=3, backoff_factor=0.5, backoff_jitter=0.5,
+                         status_forcelist=[429, 500, 502, 503, 504],
+                         allowed_methods={'GET', 'POST'}, respect_retry_after_header=True)
+
+# 控制器请求超时（秒）：(连接超时, 读取超时)，避免控制器无响应时请求永久挂起
+REQUEST_TIMEOUT = (10, 30)
+
+# 等待其他线程正在执行的相同show命令的最长时间（秒），需覆盖单次请求的全部重试和重新登录
+SHOW_COMMAND_WAIT_TIMEOUT = 360
+
+# License使用数据中客户端池的键名前缀
+POOL_PREFIX = 'License Clients License Usage for pool'
+
+# 从客户端记录中一次取出主机名和AP值
+get_hostname_ap = operator.itemgetter('Hostname', 'AP')
+
+# License摘要显示的类型: (license_usage中TOTAL行的列名, license_summary中的License名称)
+SUMMARY_LICENSE_TYPES = {
+    'AP': ('AP', 'AP'),
+    'PEF': ('PEF', 'PEFNG'),
+    'RFP': ('RF Protect', 'RFP'),
+    'MM': ('MM', 'MM'),
+    'MC-VA-RW': ('MC-VA-RW', 'MC-VA-RW'),
+}
+
+# 轮询周期完成日志的最小间隔（秒），轮询间隔较短时避免每轮都输出日志
+POLL_LOG_INTERVAL = 300
+
+# 轮询线程等待期间检查配置文件状态的间隔（秒），独立轮询进程据此感知Web进程保存的配置
+CONFIG_CHECK_INTERVAL = 30
+
+# 告警消息模板
+ALERT_TEMPLATE = (
+    "Aruba License告警 - {timestamp}\n"
+    "主机名: {hostname}\n"
+    "AP值: {ap}\n"
+    "告警门限: {threshold}\n"
+    "控制器: {controller}\n"
+    "告警类型: {atype}\n"
+)
 
 # 确保数据目录存在
 os.makedirs('data', exist_ok=True)
 os.makedirs('templates', exist_ok=True)
 os.makedirs('static', exist_ok=True)
 
+# 日志：工作线程只把日志记录放入队列，由后台监听线程写入日志文件和控制台
+# 轮询进程和多个Web worker进程会同时写同一个日志文件，因此不在进程内滚动，
+# 由logrotate等外部工具滚动，WatchedFileHandler检测到文件被移走后自动重新打开
+logger = logging.getLogger('aruba_mon')
+logger.setLevel(logging.INFO)
+log_queue = queue.Queue(-1)
+logger.addHandler(QueueHandler(log_queue))
+log_formatter = logging.Formatter('%(asctime)s %(levelname)s %(threadName)s %(message)s')
+log_file_handler = WatchedFileHandler('data/monitor.log', encoding='utf-8')
+log_file_handler.setFormatter(log_formatter)
+log_console_handler = logging.StreamHandler()
+log_console_handler.setFormatter(log_formatter)
+log_listener = QueueListener(log_queue, log_file_handler, log_console_handler)
+log_listener.start()
+atexit.register(log_listener.stop)
+
 class ArubaAPIClient:
     """Aruba API客户端类，用于与Aruba设备进行API交互"""
     
     def __init__(self, mcr_ip: str, verify_ssl: bool = False):
         self.mcr_ip = mcr_ip
         self.base_url = f"https://{mcr_ip}:4343/v1"
+        self._show_url = f"{self.base_url}/configuration/showcommand"  # show命令URL固定不变，只拼接一次
         self.verify_ssl = verify_ssl
         self.session = requests.Session()
+        # 复用HTTP连接（keep-alive），避免每次请求重新进行TCP/TLS握手
+        self.session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=4,
+                                                   max_retries=CONTROLLER_RETRY))
+        self.session.headers['Connection'] = 'keep-alive'
         self.uid_aruba = None
         self.cookies = None
+        self.username = None
+        self.password = None
+        self._login_lock = threading.Lock()  # 并发执行命令时避免重复重新登录
         
     def login(self, username: str, password: str) -> Dict[str, Any]:
         """登录到Aruba设备"""
@@ -64,18 +190,28 @@ class ArubaAPIClient:
         data = {"username": username, "password": password}
         
         try:
-            response = self.session.post(url, data=data, verify=self.verify_ssl)
+            response = self.session.post(url, data=data, verify=self.verify_ssl, timeout=REQUEST_TIMEOUT)
             response.raise_for_status()
             result = response.json()
             
             if result.get("_global_result", {}).get("status") == "0":
                 self.uid_aruba = result["_global_result"]["UIDARUBA"]
                 self.cookies = self.session.cookies
+                self.username = username
+                self.password = password
                 return {"status": "success", "message": "登录成功"}
             else:
                 return {"status": "error", "message": f"登录失败: {result}"}
         except requests.exceptions.RequestException as e:
             return {"status": "error", "message": f"登录请求异常: {e}"}
+    
+    def ensure_logged_in(self) -> Dict[str, Any]:
+        """确保会话已登录，未登录时使用上次的凭据重新登录"""
+        if self.uid_aruba:
+            return {"status": "success", "message": "已登录"}
+        if not self.username:
+            return {"status": "error", "message": "未登录，请先调用login方法"}
+        return self.login(self.username, self.password)
             
     def logout(self) -> Dict[str, Any]:
         """从Aruba设备登出"""
@@ -85,7 +221,7 @@ class ArubaAPIClient:
         url = f"{self.base_url}/api/logout"
         
         try:
-            response = self.session.get(url, verify=self.verify_ssl)
+            response = self.session.get(url, verify=self.verify_ssl, timeout=REQUEST_TIMEOUT)
             response.raise_for_status()
             result = response.json()
             
@@ -97,21 +233,111 @@ class ArubaAPIClient:
                 return {"status": "error", "message": f"登出失败: {result}"}
         except requests.exceptions.RequestException as e:
             return {"status": "error", "message": f"登出请求异常: {e}"}
+    
+    def close(self):
+        """登出并关闭底层HTTP会话"""
+        if self.uid_aruba:
+            self.logout()
+        self.session.close()
             
-    def show_command(self, command: str) -> Dict[str, Any]:
-        """执行show命令"""
+    def show_command(self, command: str, force_refresh: bool = False) -> Dict[str, Any]:
+        """
+        执行show命令，会话过期时自动重新登录并重试一次
+        
+        缓存有效期内直接返回缓存的结果，force_refresh为True时跳过缓存
+        """
+        key = (self.mcr_ip, command)
+        if not force_refresh:
+            cached = get_cached_show_result(key)
+            if cached is not None:
+                return {"status": "success", "data": cached}
+        
+        # 同一控制器上相同的命令正在执行时，等待其结果而不是重复请求
+        with show_command_cache_lock:
+            future = show_command_inflight.get(key)
+            owner = future is None
+            if owner:
+                future = show_command_inflight[key] = Future()
+        if not owner:
+            try:
+                return future.result(timeout=SHOW_COMMAND_WAIT_TIMEOUT)
+            except FutureTimeoutError:
+                return {"status": "error", "message": f"等待相同的show命令执行超时（{SHOW_COMMAND_WAIT_TIMEOUT}秒）: {command}"}
+        
+        try:
+            result = self._show_command(command, key)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with show_command_cache_lock:
+                show_command_inflight.pop(key, None)
+    
+    def _show_command(self, command: str, key: Tuple[str, str]) -> Dict[str, Any]:
+        """向控制器发送show命令请求并缓存成功的结果"""
         if not self.uid_aruba:
             return {"status": "error", "message": "未登录，请先调用login方法"}
-            
-        url = f"{self.base_url}/configuration/showcommand"
-        params = {"command": command, "UIDARUBA": self.uid_aruba}
+        
+        url = self._show_url
         
         try:
-            response = self.session.get(url, params=params, verify=self.verify_ssl)
+            params = {"command": command, "UIDARUBA": self.uid_aruba}
+            response = self.session.get(url, params=params, verify=self.verify_ssl, timeout=REQUEST_TIMEOUT)
+            
+            # UIDARUBA过期，重新登录后重试一次
+            if response.status_code == 401 and self.username:
+                with self._login_lock:
+                    # 其他线程可能已经完成重新登录
+                    if self.uid_aruba == params["UIDARUBA"]:
+                        self.uid_aruba = None
+                    login_result = self.ensure_logged_in()
+                if login_result["status"] != "success":
+                    return {"status": "error", "message": f"会话过期，重新登录失败: {login_result['message']}"}
+                params["UIDARUBA"] = self.uid_aruba
+                response = self.session.get(url, params=params, verify=self.verify_ssl, timeout=REQUEST_TIMEOUT)
+            
             response.raise_for_status()
-            return {"status": "success", "data": response.json()}
+            # 直接从原始字节解析，跳过requests的编码探测和标准库json解析
+            data = orjson.loads(response.content)
+            set_cached_show_result(key, data)
+            return {"status": "success", "data": data}
         except requests.exceptions.RequestException as e:
             return {"status": "error", "message": f"执行show命令异常: {e}"}
+        except orjson.JSONDecodeError as e:
+            return {"status": "error", "message": f"解析show命令结果异常: {e}"}
+    
+    def show_commands(self, commands: List[str], force_refresh: bool = False) -> Dict[str, Dict[str, Any]]:
+        """并发执行多条show命令，共享同一会话的连接池，返回 {命令: 执行结果}"""
+        results = show_command_executor.map(lambda command: self.show_command(command, force_refresh), commands)
+        return dict(zip(commands, results))
+
+
+def get_cached_show_result(key: Tuple[str, str]) -> Optional[Any]:
+    """读取未过期的show命令缓存结果，缓存有效期由配置show_cache_ttl（秒）决定"""
+    ttl = config_data.get('show_cache_ttl', 30)
+    with show_command_cache_lock:
+        entry = show_command_cache.get(key)
+    if entry is None or time.monotonic() - entry[0] >= ttl:
+        return None
+    return entry[1]
+
+
+def set_cached_show_result(key: Tuple[str, str], data: Any):
+    """缓存show命令结果，达到容量上限时先清理已过期的条目，仍然已满时淘汰最早缓存的条目"""
+    now = time.monotonic()
+    with show_command_cache_lock:
+        show_command_cache.pop(key, None)
+        if len(show_command_cache) >= SHOW_COMMAND_CACHE_MAXSIZE:
+            ttl = config_data.get('show_cache_ttl', 30)
+            for cached_key in [k for k, (ts, _) in show_command_cache.items() if now - ts >= ttl]:
+                del show_command_cache[cached_key]
+            # 字典按插入顺序保存，且更新条目时先删除再插入，因此最前面的条目时间戳最小
+            excess = len(show_command_cache) - SHOW_COMMAND_CACHE_MAXSIZE + 1
+            for cached_key in list(itertools.islice(show_command_cache, max(excess, 0))):
+                del show_command_cache[cached_key]
+        show_command_cache[key] = (now, data)
 
 
 class NotificationManager:
@@ -120,18 +346,24 @@ class NotificationManager:
     def __init__(self):
         self.smtp_config = {}
         self.syslog_config = {}
+        self._smtp = None  # 缓存的SMTP连接，在一个轮询周期内复用
+        self._smtp_lock = threading.RLock()  # 轮询线程和请求线程共用SMTP连接，获取、发送和关闭时加锁
+        self._syslog_sock = None  # 复用的Syslog UDP套接字
+        self._syslog_addr = None  # 预先解析的Syslog服务器地址
     
     def configure_smtp(self, smtp_server: str, smtp_port: int, username: str, password: str, 
                       from_email: str, to_emails: List[str]):
         """配置SMTP设置"""
-        self.smtp_config = {
-            'server': smtp_server,
-            'port': smtp_port,
-            'username': username,
-            'password': password,
-            'from_email': from_email,
-            'to_emails': to_emails
-        }
+        with self._smtp_lock:
+            self.close_smtp()
+            self.smtp_config = {
+                'server': smtp_server,
+                'port': smtp_port,
+                'username': username,
+                'password': password,
+                'from_email': from_email,
+                'to_emails': to_emails
+            }
     
     def configure_syslog(self, syslog_server: str, syslog_port: int):
         """配置Syslog设置"""
@@ -139,11 +371,52 @@ class NotificationManager:
             'server': syslog_server,
             'port': syslog_port
         }
+        if self._syslog_sock is None:
+            self._syslog_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        # 缓存DNS解析结果，解析失败时在发送时再重试
+        try:
+            self._syslog_addr = (socket.gethostbyname(syslog_server), syslog_port)
+        except OSError as e:
+            logger.warning(f"Syslog服务器地址解析失败: {e}")
+            self._syslog_addr = None
+    
+    def _get_smtp(self) -> smtplib.SMTP:
+        """获取SMTP连接，复用缓存的连接并用NOOP检查其是否可用，调用方需持有_smtp_lock"""
+        if self._smtp is not None:
+            try:
+                self._smtp.noop()
+                return self._smtp
+            except (smtplib.SMTPException, OSError):
+                self.close_smtp()
+        
+        # 根据端口选择SSL或普通连接
+        if self.smtp_config['port'] == 465:
+            # 使用SSL连接
+            server = smtplib.SMTP_SSL(self.smtp_config['server'], self.smtp_config['port'], timeout=10)
+        else:
+            # 使用普通连接然后启动TLS
+            server = smtplib.SMTP(self.smtp_config['server'], self.smtp_config['port'], timeout=10)
+            server.starttls()
+        
+        server.login(self.smtp_config['username'], self.smtp_config['password'])
+        self._smtp = server
+        return server
+    
+    def close_smtp(self):
+        """关闭缓存的SMTP连接"""
+        with self._smtp_lock:
+            smtp, self._smtp = self._smtp, None
+            if smtp is None:
+                return
+            try:
+                smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                smtp.close()
     
     def send_email(self, subject: str, body: str) -> bool:
         """发送邮件通知"""
         if not self.smtp_config:
-            print("SMTP配置未设置")
+            logger.warning("SMTP配置未设置")
             return False
         
         try:
@@ -154,22 +427,13 @@ class NotificationManager:
             
             msg.attach(MIMEText(body, 'plain', 'utf-8'))
             
-            # 根据端口选择SSL或普通连接
-            if self.smtp_config['port'] == 465:
-                # 使用SSL连接
-                server = smtplib.SMTP_SSL(self.smtp_config['server'], self.smtp_config['port'])
-            else:
-                # 使用普通连接然后启动TLS
-                server = smtplib.SMTP(self.smtp_config['server'], self.smtp_config['port'])
-                server.starttls()
-            
-            server.login(self.smtp_config['username'], self.smtp_config['password'])
-            server.send_message(msg)
-            server.quit()
-            print(f"邮件发送成功: {subject}")
+            with self._smtp_lock:
+                self._get_smtp().send_message(msg)
+            logger.info(f"邮件发送成功: {subject}")
             return True
         except Exception as e:
-            print(f"邮件发送失败: {e}")
+            logger.error(f"邮件发送失败: {e}")
+            self.close_smtp()
             return False
     
     def send_syslog(self, message: str) -> bool:
@@ -178,12 +442,18 @@ class NotificationManager:
             return False
         
         try:
-            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            sock.sendto(message.encode('utf-8'), (self.syslog_config['server'], self.syslog_config['port']))
-            sock.close()
+            if self._syslog_addr is None:
+                self._syslog_addr = (socket.gethostbyname(self.syslog_config['server']), self.syslog_config['port'])
+            try:
+                self._syslog_sock.sendto(message.encode('utf-8'), self._syslog_addr)
+            except OSError:
+                # 套接字异常时重建后重试一次
+                self._syslog_sock.close()
+                self._syslog_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                self._syslog_sock.sendto(message.encode('utf-8'), self._syslog_addr)
             return True
         except Exception as e:
-            print(f"Syslog发送失败: {e}")
+            logger.error(f"Syslog发送失败: {e}")
             return False
 
 
@@ -191,8 +461,13 @@ class NotificationManager:
 notification_manager = NotificationManager()
 
 
+def use_process_lock() -> bool:
+    """是否需要跨进程文件锁（仅在部署了多个WSGI worker进程时）"""
+    return fcntl is not None and os.environ.get('GUNICORN_WORKERS', '1') != '1'
+
+
 def acquire_polling_lock():
-    """获取轮询锁，防止重复启动"""
+    """获取跨进程轮询锁，防止多个worker进程重复轮询"""
     try:
         # 尝试创建并锁定文件
         lock_file = open(lock_file_path, 'w')
@@ -211,12 +486,20 @@ def release_polling_lock(lock_file):
         try:
             fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
             lock_file.close()
-            if os.path.exists(lock_file_path):
-                os.remove(lock_file_path)
         except:
             pass
 
 
+def get_file_state(st: os.stat_result) -> Tuple[int, int, int]:
+    """
+    文件状态 (inode, 修改时间, 大小)
+    
+    文件系统时间戳精度有限，两次保存可能得到相同的修改时间；
+    原子替换每次都会产生新的inode，因此一并比较inode和大小
+    """
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
 def load_config():
     """
     加载配置文件
@@ -227,16 +510,28 @@ def load_config():
     - SMTP邮件配置
     - Syslog配置
     - 告警设置
+    
+    文件状态（inode、修改时间、大小）未变化时直接使用内存中的配置，不重复解析
+    
+    返回:
+        是否从文件重新加载了配置
     """
-    global config_data
+    global config_data, config_state
     config_file = 'data/config.json'
     if os.path.exists(config_file):
         try:
-            with open(config_file, 'r', encoding='utf-8') as f:
-                config_data = json.load(f)
+            with open(config_file, 'rb') as f:
+                # 对打开的文件取状态，保证记录的状态与读到的内容对应
+                state = get_file_state(os.fstat(f.fileno()))
+                if state == config_state:
+                    return False
+                config_data = orjson.loads(f.read())
+            config_state = state
+            return True
         except Exception as e:
-            print(f"加载配置失败: {e}")
+            logger.error(f"加载配置失败: {e}")
             config_data = {}
+    return False
 
 
 def save_config():
@@ -245,23 +540,156 @@ def save_config():
     
     将当前配置数据保存到data/config.json文件中
     包括所有用户设置的配置项和告警设置
+    先写入临时文件再原子替换，避免写入中途异常导致配置文件损坏
     """
+    global config_state
     config_file = 'data/config.json'
     try:
         # 确保data目录存在
         os.makedirs('data', exist_ok=True)
         
-        with open(config_file, 'w', encoding='utf-8') as f:
-            json.dump(config_data, f, indent=2, ensure_ascii=False)
-        print(f"配置已保存到: {config_file}")
-        print(f"配置内容: {config_data}")
+        fd, tmp_path = tempfile.mkstemp(dir='data', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(orjson.dumps(config_data, option=orjson.OPT_INDENT_2))
+                f.flush()
+                os.fsync(f.fileno())
+            os.chmod(tmp_path, FILE_MODE)
+            os.replace(tmp_path, config_file)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        config_state = get_file_state(os.stat(config_file))
+        logger.info(f"配置已保存到: {config_file}")
+        logger.debug("配置内容: %s", config_data)
     except Exception as e:
-        print(f"保存配置失败: {e}")
+        logger.error(f"保存配置失败: {e}")
         raise e
 
 
-def get_license_usage(controller_ip: str, username: str, password: str) -> Dict[str, Any]:
-    """获取license使用情况"""
+def configure_notification_manager():
+    """根据当前配置设置通知管理器的SMTP和Syslog参数"""
+    if config_data.get('smtp_enabled'):
+        to_emails = [email.strip() for email in config_data['smtp_to'].split(',') if email.strip()]
+        notification_manager.configure_smtp(
+            config_data['smtp_server'],
+            config_data['smtp_port'],
+            config_data['smtp_username'],
+            config_data['smtp_password'],
+            config_data['smtp_from'],
+            to_emails
+        )
+    
+    if config_data.get('syslog_enabled'):
+        notification_manager.configure_syslog(
+            config_data['syslog_server'],
+            config_data['syslog_port']
+        )
+
+
+def append_license_log(data: Dict[str, Any]):
+    """
+    追加License数据到按天滚动的JSON Lines日志
+    
+    每次轮询在data/license_usage_YYYYmmdd.jsonl末尾追加一行紧凑JSON，
+    避免每次轮询都创建新文件
+    """
+    global license_log_file
+    now = datetime.datetime.now()
+    filename = f"data/license_usage_{now.strftime('%Y%m%d')}.jsonl"
+    record = {'ts': now.strftime("%Y-%m-%d %H:%M:%S"), **data}
+    with open(filename, 'ab') as f:
+        f.write(orjson.dumps(record) + b'\n')
+    license_log_file = filename
+
+
+def read_last_line(filename: str) -> bytes:
+    """读取文件的最后一行，从文件末尾向前按块查找，不读取整个文件"""
+    with open(filename, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        pos = end
+        data = b''
+        while pos > 0:
+            step = min(65536, pos)
+            pos -= step
+            f.seek(pos)
+            data = f.read(step) + data
+            # 末尾换行符之前还存在换行符时，说明已读到完整的最后一行
+            if data.rstrip(b'\n').rfind(b'\n') != -1:
+                break
+        lines = data.rstrip(b'\n').rsplit(b'\n', 1)
+        return lines[-1]
+
+
+def load_latest_license_data():
+    """
+    从数据日志加载最新的License数据
+    
+    轮询由独立的poll进程执行时，Web进程通过读取最新的
+    data/license_usage_*.jsonl日志获取License数据，文件未变化时不重复解析
+    """
+    global license_log_state
+    log_files = sorted(glob.glob('data/license_usage_*.jsonl'))
+    if not log_files:
+        return
+    
+    latest_file = log_files[-1]
+    try:
+        state = (latest_file, get_file_state(os.stat(latest_file)))
+        if state == license_log_state:
+            return
+        line = read_last_line(latest_file)
+        if line:
+            record = orjson.loads(line)
+            timestamp = record.pop('ts', None)
+            set_license_data(record, timestamp)
+        license_log_state = state
+    except (OSError, orjson.JSONDecodeError) as e:
+        logger.error(f"读取数据日志失败: {e}")
+
+
+def sync_license_log():
+    """进程退出时将数据日志刷入磁盘"""
+    if license_log_file and os.path.exists(license_log_file):
+        try:
+            with open(license_log_file, 'a', encoding='utf-8') as f:
+                os.fsync(f.fileno())
+        except OSError as e:
+            logger.error(f"同步数据日志失败: {e}")
+
+
+atexit.register(sync_license_log)
+
+
+def fetch_license_data(client: ArubaAPIClient, force_refresh: bool = False) -> Dict[str, Any]:
+    """使用已登录的客户端执行show命令并合并License数据"""
+    # 并发执行show license-usage和show license summary命令
+    results = client.show_commands(["show license-usage", "show license summary"], force_refresh)
+    
+    usage_result = results["show license-usage"]
+    if usage_result["status"] != "success":
+        return {"status": "error", "message": f"show license-usage命令执行失败: {usage_result['message']}"}
+    
+    summary_result = results["show license summary"]
+    if summary_result["status"] != "success":
+        logger.warning(f"警告: show license summary命令执行失败: {summary_result['message']}")
+        summary_data = {}
+    else:
+        summary_data = summary_result["data"]
+    
+    # 合并数据
+    combined_data = {
+        "license_usage": usage_result["data"],
+        "license_summary": summary_data
+    }
+    
+    return {"status": "success", "data": combined_data}
+
+
+def get_license_usage(controller_ip: str, username: str, password: str, force_refresh: bool = False) -> Dict[str, Any]:
+    """获取license使用情况（一次性登录、查询、登出）"""
     client = ArubaAPIClient(controller_ip, verify_ssl=False)
     
     try:
@@ -270,33 +698,12 @@ def get_license_usage(controller_ip: str, username: str, password: str) -> Dict[
         if login_result["status"] != "success":
             return {"status": "error", "message": f"登录失败: {login_result['message']}"}
         
-        # 执行show license-usage命令
-        usage_result = client.show_command("show license-usage")
-        if usage_result["status"] != "success":
-            client.logout()
-            return {"status": "error", "message": f"show license-usage命令执行失败: {usage_result['message']}"}
-        
-        # 执行show license summary命令
-        summary_result = client.show_command("show license summary")
-        if summary_result["status"] != "success":
-            print(f"警告: show license summary命令执行失败: {summary_result['message']}")
-            summary_data = {}
-        else:
-            summary_data = summary_result["data"]
-        
-        # 登出
-        client.logout()
-        
-        # 合并数据
-        combined_data = {
-            "license_usage": usage_result["data"],
-            "license_summary": summary_data
-        }
-        
-        return {"status": "success", "data": combined_data}
+        return fetch_license_data(client, force_refresh)
         
     except Exception as e:
         return {"status": "error", "message": f"获取license信息异常: {e}"}
+    finally:
+        client.close()
 
 
 def polling_worker():
@@ -308,148 +715,327 @@ def polling_worker():
     2. 保存数据到JSON文件
     3. 检查告警条件并发送通知
     4. 等待指定间隔后重复执行
+    
+    等待期间config_changed置位时立即醒来，重新加载配置并开始下一次轮询
     """
-    global polling_active, license_data, config_data
+    global license_data, config_data
     
-    # 获取文件锁，防止重复启动
-    lock_file = acquire_polling_lock()
-    if not lock_file:
-        print("轮询线程已在其他进程中运行，退出当前线程")
-        return
+    # 多worker进程部署时获取文件锁，防止多个进程重复轮询
+    # 进程内的重复启动由start_polling_thread保证
+    lock_file = None
+    if use_process_lock():
+        lock_file = acquire_polling_lock()
+        if not lock_file:
+            logger.warning("轮询线程已在其他进程中运行，退出当前线程")
+            return
     
-    print(f"轮询线程启动，轮询间隔: {config_data.get('polling_interval', 86400)} 分钟")
+    logger.info(f"轮询线程启动，最大轮询间隔: {config_data.get('polling_interval', 86400)} 分钟，"
+                f"最小轮询间隔: {config_data.get('min_polling_interval', 300)} 秒")
     
     # 防止重复启动的检查
-    if not polling_active:
-        print("轮询线程已停止，退出")
+    if not polling_active.is_set():
+        logger.info("轮询线程已停止，退出")
         release_polling_lock(lock_file)
         return
     
-    # 添加线程ID用于调试和跟踪
-    import threading
-    thread_id = threading.current_thread().ident
-    print(f"轮询线程ID: {thread_id}")
-    
-    # 检查是否已有相同线程在运行
-    if thread_id in active_threads:
-        print(f"警告: 线程 {thread_id} 已在运行中，退出重复线程")
-        release_polling_lock(lock_file)
-        return
+    # 自适应轮询间隔（秒）：空闲时按退避系数逐步放大，接近门限或出错时回到基础间隔
+    current_interval = None
     
-    # 注册当前线程
-    active_threads.add(thread_id)
-    print(f"注册轮询线程: {thread_id}")
+    # 整个轮询线程生命周期内复用同一个客户端会话，仅在会话失效或控制器配置变化时重新登录
+    client = None
+    client_key = None
+    last_cycle_log = None  # 上次输出轮询周期完成日志的时间
     
-    while polling_active:
-        try:
-            if config_data.get('controller_ip') and config_data.get('username') and config_data.get('password'):
-                print(f"开始轮询查询 - {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    try:
+        while polling_active.is_set():
+            try:
+                # 配置文件被其他进程修改时重新加载（文件状态未变化时不重复解析）
+                if load_config():
+                    configure_notification_manager()
                 
-                # 获取license使用情况
-                result = get_license_usage(
-                    config_data['controller_ip'],
-                    config_data['username'],
-                    config_data['password']
-                )
+                # 配置文件可能被手工修改，读取时同样限制最小值
+                max_interval = max(config_data.get('polling_interval', 86400), 1) * 60
+                base_interval = min(max(config_data.get('min_polling_interval', 300), 1), max_interval)
+                backoff = max(config_data.get('poll_backoff_factor', 1.5), 1.0)
+                if current_interval is None:
+                    current_interval = base_interval
+                current_interval = min(max(current_interval, base_interval), max_interval)
                 
-                if result["status"] == "success":
-                    license_data = result["data"]
+                sleep_seconds = current_interval
+                if config_data.get('controller_ip') and config_data.get('username') and config_data.get('password'):
+                    logger.debug("开始轮询查询")
                     
-                    # 保存到文件
-                    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-                    filename = f"data/license_usage_{timestamp}.json"
-                    with open(filename, 'w', encoding='utf-8') as f:
-                        json.dump(license_data, f, indent=2, ensure_ascii=False)
+                    # 控制器或凭据变化时丢弃旧会话
+                    key = (config_data['controller_ip'], config_data['username'], config_data['password'])
+                    if client is not None and key != client_key:
+                        client.close()
+                        client = None
+                    if client is None:
+                        client = ArubaAPIClient(config_data['controller_ip'], verify_ssl=False)
+                        client_key = key
                     
-                    print(f"License数据更新成功，检查告警条件...")
+                    # 获取license使用情况
+                    if client.username:
+                        login_result = client.ensure_logged_in()
+                    else:
+                        login_result = client.login(config_data['username'], config_data['password'])
+                    if login_result["status"] != "success":
+                        result = {"status": "error", "message": f"登录失败: {login_result['message']}"}
+                    else:
+                        result = fetch_license_data(client)
                     
-                    # 检查告警条件（使用license_usage数据）
-                    if "license_usage" in license_data:
-                        check_license_alerts(license_data["license_usage"])
+                    if result["status"] == "success":
+                        set_license_data(result["data"])
+                        
+                        # 追加到当天的数据日志文件
+                        append_license_log(license_data)
+                        
+                        logger.debug("License数据更新成功，检查告警条件...")
+                        
+                        # 检查告警条件（使用license_usage数据）
+                        if "license_usage" in license_data:
+                            check_license_alerts(license_data["license_usage"])
+                        
+                        # 发送通知（如果需要）
+                        if config_data.get('enable_notifications', False):
+                            send_notifications(license_data)
+                        
+                        # 本轮告警和通知发送完毕，关闭复用的SMTP连接
+                        notification_manager.close_smtp()
+                        
+                        # 根据AP值与门限的接近程度调整下次轮询间隔
+                        if get_max_threshold_ratio(license_data.get("license_usage", {})) > 0.8:
+                            current_interval = base_interval
+                        else:
+                            current_interval = min(current_interval * backoff, max_interval)
+                        sleep_seconds = current_interval
+                        
+                        now = time.monotonic()
+                        if last_cycle_log is None or now - last_cycle_log >= POLL_LOG_INTERVAL:
+                            logger.info(f"轮询周期完成，下次轮询间隔: {sleep_seconds:.0f} 秒")
+                            last_cycle_log = now
                     
-                    # 发送通知（如果需要）
-                    if config_data.get('enable_notifications', False):
-                        send_notifications(license_data)
+                    else:
+                        logger.warning(f"获取license信息失败: {result['message']}")
+                        current_interval = base_interval
+                        sleep_seconds = min(current_interval, 60)  # 失败时最多等待1分钟再重试
                 
-                else:
-                    print(f"获取license信息失败: {result['message']}")
-            
-            # 等待下次轮询
-            interval = config_data.get('polling_interval', 86400)  # 默认24小时
-            print(f"等待 {interval} 分钟后下次轮询...")
-            time.sleep(interval * 60)  # 转换为秒
+            except Exception as e:
+                logger.error(f"轮询异常: {e}")
+                current_interval = None
+                sleep_seconds = 60  # 出错时等待1分钟再重试
             
-        except Exception as e:
-            print(f"轮询异常: {e}")
-            time.sleep(60)  # 出错时等待1分钟再重试
+            # 等待下次轮询，配置变化或停止轮询时醒来
+            logger.debug("等待 %d 秒后下次轮询...", sleep_seconds)
+            if wait_for_config_change(sleep_seconds):
+                config_changed.clear()
+                current_interval = None
+    finally:
+        # 轮询线程结束时清理
+        if client is not None:
+            client.close()
+        logger.info("轮询线程结束")
+        release_polling_lock(lock_file)
+
+
+def wait_for_config_change(timeout: float) -> bool:
+    """
+    等待配置变化，最长等待timeout秒
+    
+    同一进程内保存配置或停止轮询时config_changed置位，立即返回；
+    独立轮询进程中没有人置位config_changed，因此每隔CONFIG_CHECK_INTERVAL秒检查一次
+    配置文件状态，Web进程保存配置后最多延迟该间隔生效
     
-    # 轮询线程结束时清理
-    print(f"轮询线程 {thread_id} 结束，清理线程跟踪")
-    active_threads.discard(thread_id)
-    release_polling_lock(lock_file)
+    返回:
+        是否因配置变化或停止轮询而提前结束等待
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        if config_changed.wait(min(remaining, CONFIG_CHECK_INTERVAL)):
+            return True
+        try:
+            if get_file_state(os.stat('data/config.json')) != config_state:
+                return True
+        except OSError:
+            pass
+
+
+def start_polling_thread():
+    """启动进程内的轮询线程；线程已在运行时唤醒它重新加载配置"""
+    global polling_thread
+    # 自动重载模式下父进程只负责监视文件变化，轮询线程只在实际运行应用的子进程中启动
+    if use_reloader and os.environ.get('WERKZEUG_RUN_MAIN') != 'true':
+        return
+    with polling_thread_lock:
+        if polling_thread and polling_thread.is_alive():
+            config_changed.set()
+            return
+        polling_active.set()
+        config_changed.clear()
+        polling_thread = threading.Thread(target=polling_worker, daemon=True)
+        polling_thread.start()
+
+
+def stop_polling():
+    """停止轮询，正在等待的轮询线程立即醒来并退出"""
+    polling_active.clear()
+    config_changed.set()
+
+
+def run_poller():
+    """
+    以独立进程运行轮询（poll子命令）
+    
+    不启动Web应用，在主线程中运行轮询，收到SIGTERM或Ctrl+C时登出并退出。
+    配置由Web进程写入data/config.json，轮询进程根据文件状态自动重新加载
+    """
+    load_config()
+    configure_notification_manager()
+    
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_polling())
+    
+    polling_active.set()
+    try:
+        polling_worker()
+    except KeyboardInterrupt:
+        logger.info("轮询进程已停止")
+
+
+def iter_pool_clients(license_usage: Dict[str, Any]):
+    """遍历所有License池中的客户端记录"""
+    pools = [pool_data for pool_name, pool_data in license_usage.items()
+             if pool_name.startswith(POOL_PREFIX)]
+    return itertools.chain.from_iterable(pools)
+
+
+def iter_hostname_ap(license_usage: Dict[str, Any]):
+    """遍历所有License池中的客户端，返回(主机名, AP值)，AP值未做类型转换"""
+    for client in iter_pool_clients(license_usage):
+        try:
+            yield get_hostname_ap(client)
+        except KeyError:
+            yield client.get('Hostname'), client.get('AP', 0)
+
+
+def get_alert_thresholds() -> Dict[str, Tuple[int, bool, bool]]:
+    """获取已设置门限的主机告警设置 {主机名: (门限, 邮件告警, Syslog告警)}"""
+    thresholds = {}
+    for hostname, settings in config_data.get('alert_settings', {}).items():
+        threshold = int(settings.get('threshold', 0))
+        if threshold > 0 and hostname != 'TOTAL':
+            thresholds[hostname] = (threshold,
+                                    settings.get('email_enabled', False),
+                                    settings.get('syslog_enabled', False))
+    return thresholds
+
+
+def get_max_threshold_ratio(license_usage: Dict[str, Any]) -> float:
+    """计算已配置门限的主机中AP值与门限的最大比值"""
+    thresholds = get_alert_thresholds()
+    max_ratio = 0.0
+    for hostname, ap_value in iter_hostname_ap(license_usage):
+        settings = thresholds.get(hostname)
+        if settings:
+            max_ratio = max(max_ratio, int(ap_value) / settings[0])
+    return max_ratio
 
 
 def check_license_alerts(license_data: Dict[str, Any]):
-    """检查License告警条件"""
+    """
+    检查License告警条件，汇总本轮所有超过门限的主机后统一发送告警
+    
+    自适应轮询在接近门限时会频繁查询，但同一主机持续超过门限时，
+    每种告警最多每个查询间隔上限（polling_interval）发送一次；
+    主机回落到门限以下后重新计时，再次超过门限时立即告警
+    """
     try:
-        print("检查License告警条件...")
+        logger.debug("检查License告警条件...")
         
         # 获取告警设置
-        alert_settings = config_data.get('alert_settings', {})
-        if not alert_settings:
-            print("没有配置告警设置")
+        thresholds = get_alert_thresholds()
+        if not thresholds:
+            logger.debug("没有配置告警设置")
             return
         
-        # 遍历所有License池
-        for pool_name, pool_data in license_data.items():
-            if pool_name.startswith('License Clients License Usage for pool'):
-                print(f"检查池: {pool_name}")
-                
-                for client in pool_data:
-                    if client.get('Hostname') and client.get('Hostname') != 'TOTAL':
-                        hostname = client['Hostname']
-                        ap_value = int(client.get('AP', 0))
-                        
-                        # 获取该主机的告警设置
-                        client_settings = alert_settings.get(hostname)
-                        if not client_settings:
-                            continue
-                        
-                        threshold = client_settings.get('threshold', 0)
-                        email_enabled = client_settings.get('email_enabled', False)
-                        syslog_enabled = client_settings.get('syslog_enabled', False)
-                        
-                        print(f"检查 {hostname}: AP={ap_value}, 门限={threshold}")
-                        
-                        # 检查是否超过门限
-                        if ap_value > threshold and threshold > 0:
-                            print(f"⚠️  告警: {hostname} 的AP值 {ap_value} 超过门限 {threshold}")
-                            
-                            # 发送邮件告警
-                            if email_enabled:
-                                send_alert_notification(hostname, ap_value, threshold, 'email')
-                            
-                            # 发送Syslog告警
-                            if syslog_enabled:
-                                send_alert_notification(hostname, ap_value, threshold, 'syslog')
-                        else:
-                            print(f"✅ {hostname}: AP={ap_value} <= 门限={threshold}")
+        email_alerts = []   # 需要邮件告警的 (主机名, AP值, 门限)
+        syslog_alerts = []  # 需要Syslog告警的 (主机名, AP值, 门限)
+        
+        now = time.monotonic()
+        repeat_interval = max(config_data.get('polling_interval', 86400), 1) * 60
+        
+        # 遍历所有License池中的客户端，只处理设置了门限的主机
+        for hostname, ap_value in iter_hostname_ap(license_data):
+            settings = thresholds.get(hostname)
+            if not settings:
+                continue
+            
+            threshold, email_enabled, syslog_enabled = settings
+            ap_value = int(ap_value)
+            
+            # 未超过门限时清除告警记录，下次超过门限时立即告警
+            if ap_value <= threshold:
+                with alert_last_sent_lock:
+                    alert_last_sent.pop((hostname, 'email'), None)
+                    alert_last_sent.pop((hostname, 'syslog'), None)
+                continue
+            
+            logger.info(f"⚠️  告警: {hostname} 的AP值 {ap_value} 超过门限 {threshold}")
+            
+            with alert_last_sent_lock:
+                email_due = now - alert_last_sent.get((hostname, 'email'), now - repeat_interval) >= repeat_interval
+                syslog_due = now - alert_last_sent.get((hostname, 'syslog'), now - repeat_interval) >= repeat_interval
+            
+            if email_enabled and email_due:
+                email_alerts.append((hostname, ap_value, threshold))
+            if syslog_enabled and syslog_due:
+                syslog_alerts.append((hostname, ap_value, threshold))
+        
+        # 发送邮件告警（所有主机合并为一封邮件）和Syslog告警（所有主机合并为一条消息）
+        for alerts, alert_type in ((email_alerts, 'email'), (syslog_alerts, 'syslog')):
+            if not alerts:
+                continue
+            result = send_batch_alert_notification(alerts, alert_type)
+            # 只记录发送成功的告警，发送失败时下次轮询重试
+            if result["status"] == "success":
+                with alert_last_sent_lock:
+                    for hostname, _, _ in alerts:
+                        alert_last_sent[(hostname, alert_type)] = now
                             
     except Exception as e:
-        print(f"检查告警条件失败: {e}")
+        logger.error(f"检查告警条件失败: {e}")
+
 
+def send_alert_notification(hostname: str, ap_value: int, threshold: int, alert_type: str) -> Dict[str, Any]:
+    """发送单个主机的告警通知"""
+    return send_batch_alert_notification([(hostname, ap_value, threshold)], alert_type)
 
-def send_alert_notification(hostname: str, ap_value: int, threshold: int, alert_type: str):
-    """发送告警通知"""
+
+def send_batch_alert_notification(alerts: List[Tuple[str, int, int]], alert_type: str) -> Dict[str, Any]:
+    """
+    发送告警通知，多个主机的告警合并为一封邮件或一条Syslog消息
+    
+    返回:
+        发送结果 {"status": ..., "message": ...}
+    """
+    hostnames = ', '.join(alert[0] for alert in alerts)
     try:
-        # 生成告警消息
+        # 生成告警消息，每个主机一段
         timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        alert_message = f"Aruba License告警 - {timestamp}\n"
-        alert_message += f"主机名: {hostname}\n"
-        alert_message += f"AP值: {ap_value}\n"
-        alert_message += f"告警门限: {threshold}\n"
-        alert_message += f"控制器: {config_data.get('controller_ip', 'N/A')}\n"
-        alert_message += f"告警类型: {alert_type}\n"
+        controller = config_data.get('controller_ip', 'N/A')
+        alert_messages = [
+            ALERT_TEMPLATE.format_map({
+                'timestamp': timestamp,
+                'hostname': hostname,
+                'ap': ap_value,
+                'threshold': threshold,
+                'controller': controller,
+                'atype': alert_type
+            })
+            for hostname, ap_value, threshold in alerts
+        ]
         
         if alert_type == 'email':
             if config_data.get('smtp_enabled', False):
@@ -465,14 +1051,18 @@ def send_alert_notification(hostname: str, ap_value: int, threshold: int, alert_
                         [config_data['smtp_to']]
                     )
                 
-                subject = f"Aruba License告警 - {hostname}"
-                success = notification_manager.send_email(subject, alert_message)
-                if success:
-                    print(f"✅ 邮件告警发送成功: {hostname}")
+                if len(alerts) == 1:
+                    subject = f"Aruba License告警 - {alerts[0][0]}"
                 else:
-                    print(f"❌ 邮件告警发送失败: {hostname}")
-            else:
-                print(f"❌ 邮件通知未启用")
+                    subject = f"Aruba License告警 ({len(alerts)}台主机)"
+                success = notification_manager.send_email(subject, '\n'.join(alert_messages))
+                if success:
+                    logger.info(f"✅ 邮件告警发送成功: {hostnames}")
+                    return {"status": "success", "message": "邮件告警发送成功"}
+                logger.error(f"❌ 邮件告警发送失败: {hostnames}")
+                return {"status": "error", "message": "邮件告警发送失败"}
+            logger.warning("❌ 邮件通知未启用")
+            return {"status": "error", "message": "邮件通知未启用"}
                 
         elif alert_type == 'syslog':
             if config_data.get('syslog_enabled', False):
@@ -484,17 +1074,25 @@ def send_alert_notification(hostname: str, ap_value: int, threshold: int, alert_
                         config_data['syslog_port']
                     )
                 
-                syslog_message = f"Aruba License Alert: {alert_message.replace(chr(10), ' ')}"
+                # 每个主机一行，合并为一个Syslog数据报发送
+                syslog_message = '\n'.join(
+                    f"Aruba License Alert: {alert_message.replace(chr(10), ' ')}"
+                    for alert_message in alert_messages
+                )
                 success = notification_manager.send_syslog(syslog_message)
                 if success:
-                    print(f"✅ Syslog告警发送成功: {hostname}")
-                else:
-                    print(f"❌ Syslog告警发送失败: {hostname}")
-            else:
-                print(f"❌ Syslog通知未启用")
+                    logger.info(f"✅ Syslog告警发送成功: {hostnames}")
+                    return {"status": "success", "message": "Syslog告警发送成功"}
+                logger.error(f"❌ Syslog告警发送失败: {hostnames}")
+                return {"status": "error", "message": "Syslog告警发送失败"}
+            logger.warning("❌ Syslog通知未启用")
+            return {"status": "error", "message": "Syslog通知未启用"}
+        
+        return {"status": "error", "message": "不支持的告警类型"}
                 
     except Exception as e:
-        print(f"发送告警通知失败: {e}")
+        logger.error(f"发送告警通知失败: {e}")
+        return {"status": "error", "message": f"发送告警失败: {e}"}
 
 
 def send_notifications(license_data: Dict[str, Any]):
@@ -535,7 +1133,84 @@ def send_notifications(license_data: Dict[str, Any]):
             notification_manager.send_syslog(syslog_message)
             
     except Exception as e:
-        print(f"发送通知失败: {e}")
+        logger.error(f"发送通知失败: {e}")
+
+
+def to_int(value: Any) -> int:
+    """将License数量转换为整数，无法转换时返回0"""
+    try:
+        return int(value or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def get_installed_counts(license_summary: Any) -> Dict[str, int]:
+    """从show license summary结果中提取各类型License的Total Installed数量"""
+    installed = {}
+    
+    items = None
+    if isinstance(license_summary, dict) and isinstance(license_summary.get('License Summary'), list):
+        items = license_summary['License Summary']
+    elif isinstance(license_summary, list):
+        items = license_summary
+    
+    if items is not None:
+        for item in items:
+            installed[item.get('License')] = to_int(item.get('Total Installed'))
+    elif isinstance(license_summary, dict):
+        # 解析类似 "AP: 100 (Total Installed: 100)" 的格式
+        for value in license_summary.values():
+            if not isinstance(value, str):
+                continue
+            for _, summary_name in SUMMARY_LICENSE_TYPES.values():
+                match = re.search(rf'{re.escape(summary_name)}:\s*(\d+).*Total Installed:\s*(\d+)', value)
+                if match:
+                    installed[summary_name] = int(match.group(2))
+    
+    return installed
+
+
+def build_license_summary(data: Dict[str, Any], timestamp: str) -> Dict[str, Any]:
+    """
+    计算License摘要
+    
+    汇总各池TOTAL行的已使用数量，结合license_summary中的Total Installed
+    计算各类型License的可用数量（Total Installed - 已使用数量）
+    """
+    used = dict.fromkeys(SUMMARY_LICENSE_TYPES, 0)
+    total_clients = 0
+    for client in iter_pool_clients(data.get('license_usage', {})):
+        if client.get('Hostname') == 'TOTAL':
+            for name, (usage_column, _) in SUMMARY_LICENSE_TYPES.items():
+                used[name] += to_int(client.get(usage_column))
+        else:
+            total_clients += 1
+    
+    installed_counts = get_installed_counts(data.get('license_summary', {}))
+    types = {}
+    for name, (_, summary_name) in SUMMARY_LICENSE_TYPES.items():
+        installed = installed_counts.get(summary_name, 0)
+        types[name] = {
+            'installed': installed,
+            'used': used[name],
+            'available': max(0, installed - used[name])
+        }
+    
+    return {'timestamp': timestamp, 'types': types, 'total_clients': total_clients}
+
+
+def set_license_data(data: Dict[str, Any], timestamp: Optional[str] = None):
+    """更新当前License数据，并预先计算License摘要供页面和API直接使用"""
+    global license_data, license_snapshot
+    if timestamp is None:
+        timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    summary = build_license_summary(data, timestamp)
+    # 按内容计算ETag：同一秒内多次更新也能区分，多个worker进程加载同一数据时ETag一致
+    content = orjson.dumps([data, summary], option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS)
+    etag = hashlib.blake2b(content, digest_size=16).hexdigest()
+    # 一次赋值发布数据、摘要和ETag，请求线程不会读到新ETag配旧数据
+    license_snapshot = (data, summary, etag)
+    license_data = data
 
 
 def calculate_usage_percentage(license_info: Dict[str, Any]) -> float:
@@ -550,6 +1225,17 @@ def calculate_usage_percentage(license_info: Dict[str, Any]) -> float:
         return 0.0
 
 
+@app.before_request
+def reload_config():
+    """
+    每个请求前检查配置文件状态，配置被其他worker进程或轮询进程修改时重新加载
+    
+    使用gunicorn等WSGI服务器运行时不会执行__main__中的load_config，也由此完成首次加载
+    """
+    if load_config():
+        configure_notification_manager()
+
+
 # Web路由
 @app.route('/')
 def index():
@@ -585,15 +1271,16 @@ def results():
     - 详细的使用情况表格
     - 告警设置界面
     """
+    if not embedded_poller:
+        load_latest_license_data()
     return render_template('results.html', 
                          license_data=license_data, 
                          config=config_data)
 
 @app.route('/debug')
 def debug():
-    """调试页面"""
-    with open('test_js_debug.html', 'r', encoding='utf-8') as f:
-        return f.read()
+    """调试页面（直接由文件发送，不经过Python读取）"""
+    return send_from_directory('.', 'test_js_debug.html', mimetype='text/html', max_age=60)
 
 
 @app.route('/api/config', methods=['POST'])
@@ -610,18 +1297,22 @@ def save_config_api():
     
     保存后自动启动轮询线程
     """
-    global config_data, polling_thread, polling_active
+    global config_data
     
     try:
-        print("收到配置保存请求")
-        print(f"请求数据: {request.form}")
+        logger.info("收到配置保存请求")
+        logger.debug("请求数据: %s", request.form)
         
         # 获取表单数据
         new_config = {
             'controller_ip': request.form.get('controller_ip', ''),
             'username': request.form.get('username', ''),
             'password': request.form.get('password', ''),
-            'polling_interval': int(request.form.get('polling_interval', 86400)),
+            # 轮询间隔至少1分钟/1秒、退避系数至少1.0，避免轮询线程无等待地循环
+            'polling_interval': max(int(request.form.get('polling_interval', 86400)), 1),
+            'min_polling_interval': max(int(request.form.get('min_polling_interval', 300)), 1),
+            'poll_backoff_factor': max(float(request.form.get('poll_backoff_factor', 1.5)), 1.0),
+            'show_cache_ttl': int(request.form.get('show_cache_ttl', 30)),
             'smtp_enabled': request.form.get('smtp_enabled') == 'on',
             'smtp_server': request.form.get('smtp_server', ''),
             'smtp_port': int(request.form.get('smtp_port', 587)),
@@ -635,12 +1326,13 @@ def save_config_api():
             'enable_notifications': request.form.get('enable_notifications') == 'on'
         }
         
-        # 保留现有的告警设置，避免丢失
+        # 保留现有的告警设置，避免丢失（先重新读取配置文件，取得其他进程保存的最新告警设置）
+        load_config()
         if 'alert_settings' in config_data:
             new_config['alert_settings'] = config_data['alert_settings']
-            print(f"保留现有告警设置: {config_data['alert_settings']}")
+            logger.debug("保留现有告警设置: %s", config_data['alert_settings'])
         
-        print(f"解析后的配置: {new_config}")
+        logger.debug("解析后的配置: %s", new_config)
         
         # 更新全局配置数据
         config_data = new_config
@@ -648,60 +1340,22 @@ def save_config_api():
         # 保存配置到文件
         save_config()
         
-        # 验证配置是否真的保存了
-        if os.path.exists('data/config.json'):
-            with open('data/config.json', 'r', encoding='utf-8') as f:
-                saved_config = json.load(f)
-            print(f"验证保存的配置: {saved_config}")
-        else:
-            print("警告: 配置文件不存在")
-        
         # 配置通知管理器
-        if config_data['smtp_enabled']:
-            to_emails = [email.strip() for email in config_data['smtp_to'].split(',') if email.strip()]
-            notification_manager.configure_smtp(
-                config_data['smtp_server'],
-                config_data['smtp_port'],
-                config_data['smtp_username'],
-                config_data['smtp_password'],
-                config_data['smtp_from'],
-                to_emails
-            )
-        
-        if config_data['syslog_enabled']:
-            notification_manager.configure_syslog(
-                config_data['syslog_server'],
-                config_data['syslog_port']
-            )
-        
-        # 重启轮询线程以应用新配置
+        configure_notification_manager()
+        
+        # 轮询由独立进程执行时，该进程会根据配置文件状态自动重新加载配置
+        if not embedded_poller:
+            return jsonify({"status": "success", "message": "配置保存成功"})
+        
+        # 通知轮询线程应用新配置（未运行时启动）
         if config_data.get('controller_ip'):
-            if polling_active:
-                print("停止现有轮询线程以应用新配置...")
-                polling_active = False
-                if polling_thread and polling_thread.is_alive():
-                    polling_thread.join(timeout=5)  # 等待最多5秒
-                
-                # 释放文件锁，允许新线程启动
-                print("释放轮询锁...")
-                if os.path.exists(lock_file_path):
-                    try:
-                        os.remove(lock_file_path)
-                    except:
-                        pass
-            
-            print("启动新的轮询线程...")
-            polling_active = True
-            polling_thread = threading.Thread(target=polling_worker, daemon=True)
-            polling_thread.start()
-            print(f"轮询线程已重启，新间隔: {config_data.get('polling_interval', 86400)} 分钟")
+            start_polling_thread()
+            logger.info(f"轮询线程已应用新配置，轮询间隔: {config_data.get('polling_interval', 86400)} 分钟")
         
         return jsonify({"status": "success", "message": "配置保存成功"})
         
     except Exception as e:
-        print(f"保存配置异常: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception(f"保存配置异常: {e}")
         return jsonify({"status": "error", "message": f"保存配置失败: {e}"})
 
 
@@ -713,13 +1367,30 @@ def get_license_api():
     返回当前缓存的License数据，包括：
     - license_usage: 详细的使用情况数据
     - license_summary: License摘要数据
+    - summary: 轮询时预先计算的License可用数量摘要
     - config: 当前配置信息
+    
+    数据和配置未变化时根据ETag返回304，不重复序列化
     """
-    return jsonify({
+    if not embedded_poller:
+        load_latest_license_data()
+    
+    data, summary, data_etag = license_snapshot
+    # 先读取配置文件状态再读取配置：load_config先替换配置再更新状态，不会出现新ETag配旧配置
+    etag = f"{data_etag}-{'-'.join(map(str, config_state or ()))}"
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+        response.set_etag(etag)
+        return response
+    
+    response = jsonify({
         "status": "success",
-        "data": license_data,
+        "data": data,
+        "summary": summary,
         "config": config_data
     })
+    response.set_etag(etag)
+    return response
 
 
 @app.route('/api/refresh', methods=['POST'])
@@ -740,16 +1411,18 @@ def refresh_license():
         result = get_license_usage(
             config_data['controller_ip'],
             config_data['username'],
-            config_data['password']
+            config_data['password'],
+            force_refresh=True
         )
         
         if result["status"] == "success":
-            global license_data
-            license_data = result["data"]
+            set_license_data(result["data"])
+            append_license_log(license_data)
             
             # 检查告警条件
-            print("手动刷新后检查告警条件...")
+            logger.info("手动刷新后检查告警条件...")
             check_license_alerts(license_data)
+            notification_manager.close_smtp()
             
             return jsonify({"status": "success", "message": "刷新成功"})
         else:
@@ -763,7 +1436,7 @@ def refresh_license():
 def get_status():
     """获取系统状态API"""
     return jsonify({
-        "polling_active": polling_active,
+        "polling_active": polling_active.is_set(),
         "last_update": datetime.datetime.now().isoformat(),
         "config_loaded": bool(config_data.get('controller_ip'))
     })
@@ -782,6 +1455,9 @@ def save_alert_settings():
         if not hostname:
             return jsonify({"status": "error", "message": "缺少主机名"})
         
+        # 修改前重新读取配置文件，避免用过期的配置覆盖其他进程保存的内容
+        load_config()
+        
         # 初始化告警设置存储
         if 'alert_settings' not in config_data:
             config_data['alert_settings'] = {}
@@ -796,7 +1472,7 @@ def save_alert_settings():
         # 保存到文件
         save_config()
         
-        print(f"保存告警设置: {hostname} - 门限:{threshold}, 邮件:{email_enabled}, Syslog:{syslog_enabled}")
+        logger.info(f"保存告警设置: {hostname} - 门限:{threshold}, 邮件:{email_enabled}, Syslog:{syslog_enabled}")
         
         return jsonify({"status": "success", "message": "告警设置保存成功"})
         
@@ -827,77 +1503,51 @@ def send_alert():
         if not all([hostname, ap_value, threshold, alert_type]):
             return jsonify({"status": "error", "message": "缺少必要参数"})
         
-        # 生成告警消息
-        timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        alert_message = f"Aruba License告警 - {timestamp}\n"
-        alert_message += f"主机名: {hostname}\n"
-        alert_message += f"AP值: {ap_value}\n"
-        alert_message += f"告警门限: {threshold}\n"
-        alert_message += f"控制器: {config_data.get('controller_ip', 'N/A')}\n"
-        alert_message += f"告警类型: {alert_type}\n"
-        
-        if alert_type == 'email':
-            # 发送邮件告警
-            if config_data.get('smtp_enabled', False):
-                # 确保通知管理器已配置
-                if not notification_manager.smtp_config:
-                    # 配置SMTP
-                    notification_manager.configure_smtp(
-                        config_data['smtp_server'],
-                        config_data['smtp_port'],
-                        config_data['smtp_username'],
-                        config_data['smtp_password'],
-                        config_data['smtp_from'],
-                        [config_data['smtp_to']]
-                    )
-                
-                subject = f"Aruba License告警 - {hostname}"
-                success = notification_manager.send_email(subject, alert_message)
-                if success:
-                    return jsonify({"status": "success", "message": "邮件告警发送成功"})
-                else:
-                    return jsonify({"status": "error", "message": "邮件告警发送失败"})
-            else:
-                return jsonify({"status": "error", "message": "邮件通知未启用"})
-                
-        elif alert_type == 'syslog':
-            # 发送Syslog告警
-            if config_data.get('syslog_enabled', False):
-                # 确保通知管理器已配置
-                if not notification_manager.syslog_config:
-                    # 配置Syslog
-                    notification_manager.configure_syslog(
-                        config_data['syslog_server'],
-                        config_data['syslog_port']
-                    )
-                
-                syslog_message = f"Aruba License Alert: {alert_message.replace(chr(10), ' ')}"
-                success = notification_manager.send_syslog(syslog_message)
-                if success:
-                    return jsonify({"status": "success", "message": "Syslog告警发送成功"})
-                else:
-                    return jsonify({"status": "error", "message": "Syslog告警发送失败"})
-            else:
-                return jsonify({"status": "error", "message": "Syslog通知未启用"})
-        else:
-            return jsonify({"status": "error", "message": "不支持的告警类型"})
+        result = send_alert_notification(hostname, ap_value, threshold, alert_type)
+        notification_manager.close_smtp()
+        return jsonify(result)
             
     except Exception as e:
         return jsonify({"status": "error", "message": f"发送告警失败: {e}"})
 
 
-if __name__ == '__main__':
-    # 加载配置
-    load_config()
+def run_server(host: str = '0.0.0.0', port: int = 5005):
+    """
+    启动Web服务器
     
-    # 如果配置了控制器信息，启动轮询（仅在应用启动时）
-    if config_data.get('controller_ip') and not polling_active:
-        polling_active = True
-        polling_thread = threading.Thread(target=polling_worker, daemon=True)
-        polling_thread.start()
-        print("应用启动时轮询线程已启动")
-    elif polling_active:
-        print("轮询线程已在运行中，跳过启动")
+    非调试模式下优先使用waitress多线程WSGI服务器，未安装时使用Flask内置的多线程服务器；
+    调试模式默认不启用自动重载，设置FLASK_USE_RELOADER=1时启用，轮询线程只在重载子进程中运行
+    """
+    if waitress_serve is not None and not flask_debug:
+        logger.info(f"使用waitress启动Web服务器: {host}:{port}")
+        waitress_serve(app, host=host, port=port, threads=8)
+    else:
+        app.run(host=host, port=port, debug=flask_debug, use_reloader=use_reloader, threaded=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Aruba License Monitor')
+    subparsers = parser.add_subparsers(dest='command')
+    serve_parser = subparsers.add_parser('serve', help='启动Web应用（默认）')
+    serve_parser.add_argument('--no-poller', action='store_true',
+                              help='不在Web进程内轮询，由独立的poll进程负责')
+    subparsers.add_parser('poll', help='仅运行后台轮询，不启动Web应用')
+    args = parser.parse_args()
     
-    # 启动Web应用
-    app.run(host='0.0.0.0', port=5005, debug=True)
+    if args.command == 'poll':
+        run_poller()
+    else:
+        if getattr(args, 'no_poller', False):
+            embedded_poller = False
+        
+        # 加载配置
+        load_config()
+        configure_notification_manager()
+        
+        # 如果配置了控制器信息，启动轮询（仅在应用启动时）
+        if embedded_poller and config_data.get('controller_ip'):
+            start_polling_thread()
+            logger.info("应用启动时轮询线程已启动")
+        
+        # 启动Web应用
+        run_server()
@@ -14,10 +14,17 @@ Aruba控制器License监控API客户端
 """
 
 import os
-import json
+import sys
+import atexit
+import queue
+import tempfile
+import threading
 import time
-import datetime
+import orjson
 import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from typing import Dict, Any, List, Optional, Tuple
 from flask import Blueprint, request, jsonify
 
@@ -27,8 +34,29 @@ topn_api = Blueprint('topn_api', __name__)
 # 禁用SSL警告
 requests.packages.urllib3.disable_warnings()
 
-# 存储客户端实例的字典
+# 存储客户端实例的字典，键为 (控制器IP, 用户名)
 clients = {}
+clients_lock = threading.RLock()  # 保护clients的读取和修改，Web请求线程与轮询线程可能同时访问
+
+# 控制器请求超时（秒）：(连接超时, 读取超时)，避免控制器无响应时请求永久挂起
+REQUEST_TIMEOUT = (10, 30)
+
+# 结果文件权限：mkstemp创建的临时文件为0600，替换前改回按umask计算的默认权限
+# （umask只能通过设置来读取，在导入时读取一次）
+file_umask = os.umask(0)
+os.umask(file_umask)
+FILE_MODE = 0o666 & ~file_umask
+
+# 保存结果文件的orjson选项：缩进2格，允许非字符串键（输出为UTF-8，不转义中文）
+JSON_DUMP_OPTIONS = orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS
+
+# 获取License信息时在同一会话中执行的show命令
+LICENSE_COMMANDS = ["show license-usage", "show license summary"]
+
+# 结果文件后台写入队列，元素为 (文件名, 文件内容)，None表示停止写入线程
+result_write_queue = queue.Queue()
+result_writer_thread = None
+result_writer_lock = threading.Lock()
 
 # 确保数据目录存在
 os.makedirs('data', exist_ok=True)
@@ -54,10 +82,22 @@ class ArubaAPIClient:
         """
         self.mcr_ip = mcr_ip
         self.base_url = f"https://{mcr_ip}:4343/v1"
+        self._show_url = f"{self.base_url}/configuration/showcommand"  # show命令URL固定不变，只拼接一次
         self.verify_ssl = verify_ssl
         self.session = requests.Session()
+        # 使用连接池并保持长连接，多次请求复用同一个TCP/TLS连接
+        # 连接错误及429/5xx时指数退避（带随机抖动）重试，429优先遵循Retry-After
+        retry = Retry(total=3, backoff_factor=0.5, backoff_jitter=0.5,
+                      status_forcelist=[429, 500, 502, 503, 504],
+                      allowed_methods={'GET', 'POST'}, respect_retry_after_header=True)
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, pool_block=False, max_retries=retry)
+        self.session.mount('https://', adapter)
+        self.session.headers['Connection'] = 'keep-alive'
         self.uid_aruba = None
         self.cookies = None
+        self.username = None
+        self.password = None
+        self._login_lock = threading.Lock()  # 并发执行命令时避免重复重新登录
         
     def login(self, username: str, password: str) -> Dict[str, Any]:
         """
@@ -77,23 +117,42 @@ class ArubaAPIClient:
         }
         
         try:
-            response = self.session.post(url, data=data, verify=self.verify_ssl)
+            response = self.session.post(url, data=data, verify=self.verify_ssl, timeout=REQUEST_TIMEOUT)
             response.raise_for_status()
             
             result = response.json()
             if result.get("_global_result", {}).get("status") == "0":
                 self.uid_aruba = result["_global_result"]["UIDARUBA"]
                 self.cookies = self.session.cookies
+                self.username = username
+                self.password = password
                 return {"status": "success", "message": "登录成功"}
             else:
                 return {"status": "error", "message": f"登录失败: {result}"}
         except requests.exceptions.RequestException as e:
             return {"status": "error", "message": f"登录请求异常: {e}"}
             
+    def ensure_logged_in(self) -> Dict[str, Any]:
+        """
+        确保会话已登录
+        
+        已登录时直接返回，会话失效时使用上次登录的凭据重新登录
+        
+        返回:
+            登录结果
+        """
+        if self.uid_aruba:
+            return {"status": "success", "message": "已登录"}
+        if not self.username:
+            return {"status": "error", "message": "未登录，请先调用login方法"}
+        return self.login(self.username, self.password)
+            
     def logout(self) -> Dict[str, Any]:
         """
         从Aruba设备登出
         
+        只清除登录状态，保留底层HTTP会话以便复用连接
+        
         返回:
             登出响应的JSON数据
         """
@@ -103,7 +162,7 @@ class ArubaAPIClient:
         url = f"{self.base_url}/api/logout"
         
         try:
-            response = self.session.get(url, verify=self.verify_ssl)
+            response = self.session.get(url, verify=self.verify_ssl, timeout=REQUEST_TIMEOUT)
             response.raise_for_status()
             
             result = response.json()
@@ -129,22 +188,61 @@ class ArubaAPIClient:
         if not self.uid_aruba:
             return {"status": "error", "message": "未登录，请先调用login方法"}
             
-        url = f"{self.base_url}/configuration/showcommand"
-        params = {
-            "command": command,
-            "UIDARUBA": self.uid_aruba
-        }
+        url = self._show_url
+        params = {"command": command, "UIDARUBA": self.uid_aruba}
         
         try:
-            response = self.session.get(url, params=params, verify=self.verify_ssl)
+            response = self.session.get(url, params=params, verify=self.verify_ssl, timeout=REQUEST_TIMEOUT)
+            
+            # UIDARUBA过期时重新登录并重试一次
+            if response.status_code == 401 and self.username:
+                with self._login_lock:
+                    # 其他线程可能已经完成重新登录
+                    if self.uid_aruba == params["UIDARUBA"]:
+                        self.uid_aruba = None
+                    login_result = self.ensure_logged_in()
+                if login_result["status"] != "success":
+                    return {"status": "error", "message": f"会话过期，重新登录失败: {login_result['message']}"}
+                params["UIDARUBA"] = self.uid_aruba
+                response = self.session.get(url, params=params, verify=self.verify_ssl, timeout=REQUEST_TIMEOUT)
+            
             response.raise_for_status()
             
-            return {"status": "success", "data": response.json()}
+            # 直接从原始字节解析，跳过requests的编码探测和标准库json解析
+            return {"status": "success", "data": orjson.loads(response.content)}
         except requests.exceptions.RequestException as e:
             return {"status": "error", "message": f"执行show命令异常: {e}"}
+        except orjson.JSONDecodeError as e:
+            return {"status": "error", "message": f"解析show命令结果异常: {e}"}
+    
+    def show_commands(self, commands: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        在同一登录会话中并发执行多条show命令
+        
+        所有命令复用同一个UIDARUBA和连接池中保持的HTTP连接，只需一次登录和登出，
+        各命令的请求同时发出，总耗时取决于最慢的一条命令
+        
+        参数:
+            commands: 要执行的show命令列表
+            
+        返回:
+            {命令: 命令执行结果}
+        """
+        with ThreadPoolExecutor(max_workers=len(commands)) as executor:
+            return dict(zip(commands, executor.map(self.show_command, commands)))
+    
+    def close(self):
+        """
+        关闭客户端
+        
+        登出（如已登录）并关闭底层HTTP会话，释放连接池
+        """
+        if self.uid_aruba:
+            self.logout()
+        self.session.close()
 
 
-def get_client_key(controller_ip: str, username: str) -> str:
+def get_client_key(controller_ip: str, username: str) -> Tuple[str, str]:
     """
     生成客户端实例的唯一键
     
@@ -153,9 +251,67 @@ def get_client_key(controller_ip: str, username: str) -> str:
         username: 用户名
         
     返回:
-        客户端键
+        客户端键 (控制器IP, 用户名)
     """
-    return f"{controller_ip}_{username}"
+    return (controller_ip, username)
+
+
+def get_client(controller_ip: str, username: str, password: str) -> Tuple[Optional[ArubaAPIClient], Dict[str, Any]]:
+    """
+    获取已登录的客户端实例
+    
+    同一控制器和用户名的客户端在多次调用之间复用，保持会话和连接，
+    仅在首次使用或会话失效时登录
+    
+    参数:
+        controller_ip: 控制器IP地址
+        username: 用户名
+        password: 密码
+        
+    返回:
+        (客户端实例, 登录结果)，登录失败时客户端实例为None
+    """
+    client_key = get_client_key(controller_ip, username)
+    
+    with clients_lock:
+        entry = clients.get(client_key)
+        if entry is None:
+            entry = clients[client_key] = {"client": ArubaAPIClient(controller_ip, verify_ssl=False)}
+    client = entry["client"]
+    
+    if client.username == username and client.password == password:
+        login_result = client.ensure_logged_in()
+    else:
+        login_result = client.login(username, password)
+    
+    if login_result["status"] != "success":
+        return None, login_result
+    return client, login_result
+
+
+def release_client(controller_ip: str, username: str) -> Optional[Dict[str, Any]]:
+    """
+    释放客户端实例
+    
+    从缓存中删除客户端，登出并关闭底层HTTP会话
+    
+    参数:
+        controller_ip: 控制器IP地址
+        username: 用户名
+        
+    返回:
+        登出结果，客户端不存在时返回None
+    """
+    with clients_lock:
+        entry = clients.pop(get_client_key(controller_ip, username), None)
+    
+    if entry is None:
+        return None
+    
+    client = entry["client"]
+    logout_result = client.logout()
+    client.close()
+    return logout_result
 
 
 def logout():
@@ -171,25 +327,113 @@ def logout():
     if not all([controller_ip, username]):
         return jsonify({"status": "error", "message": "缺少必要参数"})
         
-    # 获取客户端实例
-    client_key = get_client_key(controller_ip, username)
+    # 删除客户端实例，登出并释放连接
+    logout_result = release_client(controller_ip, username)
     
-    if client_key not in clients:
+    if logout_result is None:
         return jsonify({"status": "error", "message": "客户端不存在"})
-        
-    # 登出
-    logout_result = clients[client_key]["client"].logout()
-    
-    # 删除客户端实例
-    del clients[client_key]
     
     return jsonify(logout_result)
 
 
+def write_file_atomic(filename: str, content: bytes):
+    """
+    原子写入文件
+    
+    先写入同目录下的临时文件再替换目标文件，避免写入中途异常留下不完整的文件
+    
+    参数:
+        filename: 目标文件名
+        content: 文件内容
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(filename) or '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        os.chmod(tmp_path, FILE_MODE)
+        os.replace(tmp_path, filename)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def result_writer_loop():
+    """后台写入线程：依次取出队列中的结果文件并写入磁盘，写入完成后输出保存结果"""
+    while True:
+        item = result_write_queue.get()
+        if item is None:
+            return
+        filename, content = item
+        try:
+            write_file_atomic(filename, content)
+            print(f"📄 结果已保存到: {filename}")
+        except OSError as e:
+            print(f"❌ 保存结果文件失败 {filename}: {e}")
+
+
+def stop_result_writer():
+    """程序退出前等待队列中的结果文件全部写入"""
+    result_write_queue.put(None)
+    result_writer_thread.join()
+
+
+def save_result_file(filename: str, data: Dict[str, Any]):
+    """
+    保存结果文件
+    
+    在调用线程中完成序列化，写入磁盘交给后台线程执行，调用方不必等待磁盘I/O
+    
+    参数:
+        filename: 结果文件名
+        data: 要保存的数据
+    """
+    global result_writer_thread
+    content = orjson.dumps(data, option=JSON_DUMP_OPTIONS)
+    
+    with result_writer_lock:
+        if result_writer_thread is None:
+            result_writer_thread = threading.Thread(target=result_writer_loop, name='result_writer', daemon=True)
+            result_writer_thread.start()
+            atexit.register(stop_result_writer)
+    
+    result_write_queue.put((filename, content))
+
+
+def combine_license_results(results: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    合并show license-usage和show license summary的执行结果
+    
+    参数:
+        results: show_commands返回的 {命令: 命令执行结果}
+        
+    返回:
+        与Web应用数据格式一致的 {"license_usage": ..., "license_summary": ...}
+    """
+    summary_result = results["show license summary"]
+    return {
+        "license_usage": results["show license-usage"]["data"],
+        "license_summary": summary_result["data"] if summary_result["status"] == "success" else {}
+    }
+
+
+def extract_licenses(data: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    从show license-usage的结果中取出所有License记录
+    
+    参数:
+        data: show license-usage命令返回的数据
+        
+    返回:
+        License记录列表
+    """
+    return [item["License"] for item in data.get("_data", ()) if "License" in item]
+
+
 def get_license_usage_example():
     """
     示例：获取license使用情况的完整流程
-    演示如何登录、执行show license-usage命令、然后登出
+    演示如何登录、在同一会话中执行show license-usage和show license summary命令、然后登出
     """
     # 配置参数
     controller_ip = "10.0.60.60"  # 替换为实际的控制器IP
@@ -201,23 +445,21 @@ def get_license_usage_example():
     print("=" * 50)
     
 
-    # 创建API客户端
-    client = ArubaAPIClient(controller_ip, verify_ssl=False)
-    
     try:
-        # 步骤1: 登录
+        # 步骤1: 获取已登录的客户端
         print("步骤1: 正在登录到Aruba控制器...")
-        login_result = client.login(username, password)
+        client, login_result = get_client(controller_ip, username, password)
         
-        if login_result["status"] != "success":
+        if client is None:
             print(f"❌ 登录失败: {login_result['message']}")
             return False
             
         print(f"✅ {login_result['message']}")
         
-        # 步骤2: 执行show license-usage命令
-        print("\n步骤2: 正在执行 'show license-usage' 命令...")
-        command_result = client.show_command("show license-usage")
+        # 步骤2: 在同一会话中执行show license-usage和show license summary命令
+        print("\n步骤2: 正在执行 'show license-usage' 和 'show license summary' 命令...")
+        results = client.show_commands(LICENSE_COMMANDS)
+        command_result = results["show license-usage"]
         
         if command_result["status"] != "success":
             print(f"❌ 命令执行失败: {command_result['message']}")
@@ -225,34 +467,35 @@ def get_license_usage_example():
             
         print("✅ 命令执行成功")
         
+        summary_result = results["show license summary"]
+        if summary_result["status"] != "success":
+            print(f"⚠️  show license summary执行失败: {summary_result['message']}")
+        
         # 保存结果到文件
-        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        timestamp = time.strftime("%Y%m%d_%H%M%S")
         filename = f"data/license_usage_{timestamp}.json"
         
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(command_result["data"], f, indent=2, ensure_ascii=False)
-        
-        print(f"📄 结果已保存到: {filename}")
+        # 后台写入，保存结果由写入线程在写入完成后输出
+        save_result_file(filename, combine_license_results(results))
         
-        # 显示部分结果
-        print("\n📊 License使用情况摘要:")
-        print("-" * 30)
+        # 显示部分结果（先拼接所有行，再一次性输出）
+        lines = ["\n📊 License使用情况摘要:", "-" * 30]
         
         # 解析并显示license信息
-        data = command_result["data"]
-        if "_data" in data:
-            for item in data["_data"]:
-                if "License" in item:
-                    license_info = item["License"]
-                    print(f"License类型: {license_info.get('Type', 'N/A')}")
-                    print(f"已使用: {license_info.get('Used', 'N/A')}")
-                    print(f"总数: {license_info.get('Total', 'N/A')}")
-                    print(f"剩余: {license_info.get('Available', 'N/A')}")
-                    print("-" * 30)
+        for license_info in extract_licenses(command_result["data"]):
+            get = license_info.get
+            lines += [
+                f"License类型: {get('Type', 'N/A')}",
+                f"已使用: {get('Used', 'N/A')}",
+                f"总数: {get('Total', 'N/A')}",
+                f"剩余: {get('Available', 'N/A')}",
+                "-" * 30,
+            ]
+        sys.stdout.write("\n".join(lines) + "\n")
         
         # 步骤3: 登出
         print("\n步骤3: 正在登出...")
-        logout_result = client.logout()
+        logout_result = release_client(controller_ip, username)
         
         if logout_result["status"] != "success":
             print(f"⚠️  登出失败: {logout_result['message']}")
@@ -263,12 +506,10 @@ def get_license_usage_example():
         
     except Exception as e:
         print(f"❌ 发生异常: {e}")
-        # 确保登出
-        try:
-            client.logout()
-        except:
-            pass
         return False
+    finally:
+        # 确保登出并释放连接
+        release_client(controller_ip, username)
 
 
 def interactive_license_check():
@@ -289,65 +530,72 @@ def interactive_license_check():
         print("❌ 参数不完整，退出")
         return
     
-    # 创建API客户端
-    client = ArubaAPIClient(controller_ip, verify_ssl=False)
-    
     try:
-        # 登录
+        # 登录（客户端缓存在clients中，重复查询时复用同一会话和连接）
         print(f"\n正在连接到 {controller_ip}...")
-        login_result = client.login(username, password)
+        client, login_result = get_client(controller_ip, username, password)
         
-        if login_result["status"] != "success":
+        if client is None:
             print(f"❌ 登录失败: {login_result['message']}")
             return
             
         print("✅ 登录成功")
         
-        # 执行license-usage命令
-        print("正在获取license使用情况...")
-        command_result = client.show_command("show license-usage")
-        
-        if command_result["status"] != "success":
-            print(f"❌ 获取license信息失败: {command_result['message']}")
-            return
+        while True:
+            # 在同一会话中执行license-usage和license summary命令
+            print("正在获取license使用情况...")
+            results = client.show_commands(LICENSE_COMMANDS)
+            command_result = results["show license-usage"]
             
-        print("✅ 获取license信息成功")
-        
-        # 保存结果
-        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"data/license_usage_{controller_ip}_{timestamp}.json"
-        
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(command_result["data"], f, indent=2, ensure_ascii=False)
-        
-        print(f"📄 结果已保存到: {filename}")
-        
-        # 显示license信息
-        print("\n📊 License使用情况:")
-        print("=" * 40)
-        
-        data = command_result["data"]
-        if "_data" in data:
-            for item in data["_data"]:
-                if "License" in item:
-                    license_info = item["License"]
-                    print(f"类型: {license_info.get('Type', 'N/A')}")
-                    print(f"已使用: {license_info.get('Used', 'N/A')}")
-                    print(f"总数: {license_info.get('Total', 'N/A')}")
-                    print(f"可用: {license_info.get('Available', 'N/A')}")
-                    print("-" * 40)
+            if command_result["status"] != "success":
+                print(f"❌ 获取license信息失败: {command_result['message']}")
+                break
+                
+            print("✅ 获取license信息成功")
+            
+            summary_result = results["show license summary"]
+            if summary_result["status"] != "success":
+                print(f"⚠️  获取license摘要失败: {summary_result['message']}")
+            
+            # 保存结果
+            timestamp = time.strftime("%Y%m%d_%H%M%S")
+            filename = f"data/license_usage_{controller_ip}_{timestamp}.json"
+            
+            # 后台写入，保存结果由写入线程在写入完成后输出
+            save_result_file(filename, combine_license_results(results))
+            
+            # 显示license信息（先拼接所有行，再一次性输出）
+            lines = ["\n📊 License使用情况:", "=" * 40]
+            
+            for license_info in extract_licenses(command_result["data"]):
+                get = license_info.get
+                lines += [
+                    f"类型: {get('Type', 'N/A')}",
+                    f"已使用: {get('Used', 'N/A')}",
+                    f"总数: {get('Total', 'N/A')}",
+                    f"可用: {get('Available', 'N/A')}",
+                    "-" * 40,
+                ]
+            sys.stdout.write("\n".join(lines) + "\n")
+            
+            if input("\n是否再次查询? (y/N): ").strip().lower() != 'y':
+                break
+            # 会话失效时使用缓存的凭据重新登录，否则直接复用
+            client, login_result = get_client(controller_ip, username, password)
+            if client is None:
+                print(f"❌ 重新登录失败: {login_result['message']}")
+                break
         
         # 登出
         print("\n正在登出...")
-        logout_result = client.logout()
+        logout_result = release_client(controller_ip, username)
         print(f"✅ {logout_result['message']}")
         
     except Exception as e:
         print(f"❌ 发生异常: {e}")
-        try:
-            client.logout()
-        except:
-            pass
+    finally:
+        # 确保登出并释放连接
+        release_client(controller_ip, username)
 
 
 if __name__ == "__main__":
@@ -14,7 +14,7 @@ Aruba License监控Web应用启动器
 
 import os
 import sys
-from app import app, load_config
+from app import load_config, run_server, flask_debug, waitress_serve
 
 def main():
     """
@@ -31,12 +31,9 @@ def main():
     print("=" * 60)
     print("正在启动Web应用程序...")
     
-    # 检查并创建必要的目录
-    required_dirs = ['data', 'templates', 'static']
-    for dir_name in required_dirs:
-        if not os.path.exists(dir_name):
-            os.makedirs(dir_name)
-            print(f"创建目录: {dir_name}")
+    # 创建必要的目录（已存在时不做任何操作）
+    for dir_name in ('data', 'templates', 'static'):
+        os.makedirs(dir_name, exist_ok=True)
     
     # 加载应用配置
     load_config()
@@ -44,7 +41,8 @@ def main():
     print("Web应用程序配置:")
     print(f"- 主机: 0.0.0.0")
     print(f"- 端口: 5005")
-    print(f"- 调试模式: 开启")
+    print(f"- 调试模式: {'开启' if flask_debug else '关闭'}")
+    print(f"- 服务器: {'waitress' if waitress_serve is not None and not flask_debug else 'Flask内置服务器'}")
     print("=" * 60)
     print("访问地址:")
     print("http://localhost:5005 - 结果页面")
@@ -54,8 +52,8 @@ def main():
     print("=" * 60)
     
     try:
-        # 启动Flask应用
-        app.run(host='0.0.0.0', port=5005, debug=True)
+        # 启动Web服务器
+        run_server()
     except KeyboardInterrupt:
         print("\n服务器已停止")
     except Exception as e: